@@ -30,16 +30,24 @@ BROWSERS = ["xdg-open", "x-www-browser",
             "firefox", "chromium", "chrome", "opera"]
 # The webbrowser module is used when nothing is found in this list.
 # This especially happens on Windows and Mac OS X (browser mostly not in PATH)
+# read backend output in large chunks (pipes are unbuffered on Python 2)
+PIPE_BUFSIZE = 65536
+# seconds cached MusicBrainz data is used, others might edit in between
+# (our own edits remove the cache with WebService2.clear_cached)
+CACHE_TTL = 3600
 
 import os
 import re
 import sys
+import json
 import codecs
 import logging
 import getpass
 import tempfile
+import time
 import webbrowser
 from datetime import datetime
+from collections import defaultdict
 from optparse import OptionParser
 from subprocess import Popen, PIPE, call
 
@@ -54,9 +62,6 @@ except ImportError:
         # When both are not available, raise exception for python-discid
         import discid
 
-import musicbrainzngs
-from musicbrainzngs import AuthenticationError, ResponseError, WebServiceError
-
 try:
     import keyring
 except ImportError:
@@ -67,6 +72,11 @@ try:
 except ImportError:
     from ConfigParser import ConfigParser
 
+try:
+    from shutil import which as shutil_which
+except ImportError:
+    shutil_which = None     # Python < 3.3, the external "which" is used
+
 if os.name == "nt":
     SHELLNAME = "isrcsubmit.bat"
 else:
@@ -87,10 +97,17 @@ try:
 except NameError:
     unicode_string = str
 
+# the encoding is None when piped on Python 2
+STDIN_ENCODING = getattr(sys.stdin, "encoding", None) or "utf-8"
+STDOUT_ENCODING = getattr(sys.stdout, "encoding", None) or "utf-8"
+
 # global variables
 options = None
 ws2 = None
+musicbrainzngs = None   # imported with the first WebService2
 logger = logging.getLogger("isrcsubmit")
+program_cache = {}      # (program, strict): found
+DEVNULL = open(os.devnull, "w")
 
 def script_version():
     return "isrcsubmit %s by JonnyJD for MusicBrainz" % __version__
@@ -121,21 +138,20 @@ class Isrc(object):
     def __init__(self, isrc, track=None):
         self._id = isrc
         self._tracks = []
+        self._track_ids = set()     # same equality as Track
         if track is not None:
-            self._tracks.append(track)
+            self.add_track(track)
 
     def add_track(self, track):
-        if track not in self._tracks:
+        if track["id"] not in self._track_ids:
+            self._track_ids.add(track["id"])
             self._tracks.append(track)
 
     def get_tracks(self):
         return self._tracks
 
     def get_track_numbers(self):
-        numbers = []
-        for track in self._tracks:
-            numbers.append(track["position"])
-        return ", ".join(numbers)
+        return ", ".join([track["position"] for track in self._tracks])
 
 
 class Track(dict):
@@ -150,22 +166,28 @@ class Track(dict):
         self._number = number
         # check that we found the track with the correct number
         assert(int(self._track["position"]) == self._number)
+        self._isrcs = frozenset(self.get("isrc-list", []))
 
     def __eq__(self, other):
         return self["id"] == other["id"]
 
     def __getitem__(self, item):
-        try:
+        if item in self._recording:
             return self._recording[item]
-        except KeyError:
+        else:
             return self._track[item]
 
     def get(self, item, default=None):
-        try:
-            return self._recording.get(item, default)
-        except KeyError:
+        if item in self._recording:
+            return self._recording[item]
+        else:
             return self._track.get(item, default)
 
+    def has_isrc(self, isrc):
+        """check if the ISRC is already attached to the recording
+        """
+        return isrc in self._isrcs
+
 class OwnTrack(Track):
     """A track found on an analyzed (own) disc"""
     pass
@@ -186,6 +208,18 @@ def config_path():
 
     return os.path.join(get_config_home(), "config")
 
+def get_cache_home():
+    """Returns the base directory for isrcsubmit's cached web service data."""
+
+    if os.name == "nt":
+        default_location = os.environ.get("LOCALAPPDATA",
+                                          os.environ.get("APPDATA"))
+    else:
+        default_location = os.path.expanduser("~/.cache")
+
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME", default_location)
+    return os.path.join(xdg_cache_home, "isrcsubmit")
+
 def gather_options(argv):
     global options
 
@@ -231,6 +265,9 @@ def gather_options(argv):
     parser.add_option("--debug", action="store_true", default=False,
             help="Show debug messages."
             + " Currently shows some backend messages.")
+    parser.add_option("--no-cache", action="store_false", dest="cache",
+            default=True,
+            help="Don't use cached MusicBrainz data from previous runs.")
     parser.add_option("--keyring", action="store_true", dest="keyring",
             help="Use keyring if available.")
     parser.add_option("--no-keyring", action="store_false", dest="keyring",
@@ -272,8 +309,6 @@ def gather_options(argv):
     if options.device is None:
         options.device = default_device
     options.sane_which = test_which()
-    if options.browser is None:
-        options.browser = find_browser()
     if options.server is None:
         options.server = DEFAULT_SERVER
     if options.keyring is None:
@@ -293,69 +328,100 @@ def test_which():
     We want to know if the user has a "sane" which we can trust.
     Unxutils has a broken 2.4 version. Which >= 2.16 should be fine.
     """
-    with open(os.devnull, "w") as devnull:
-        try:
-            # "which" should at least find itself
-            return_code = call(["which", "which"],
-                               stdout=devnull, stderr=devnull)
-        except OSError:
-            return False        # no which at all
+    if shutil_which is not None:
+        return True         # we don't need an external which
+    try:
+        # "which" should at least find itself
+        return_code = call(["which", "which"], stdout=DEVNULL, stderr=DEVNULL)
+    except OSError:
+        return False        # no which at all
+    else:
+        if (return_code == 0):
+            return True
         else:
-            if (return_code == 0):
-                return True
-            else:
-                print('warning: your version of the tool "which"'
-                      ' is buggy/outdated')
-                if os.name == "nt":
-                    print('         unxutils is old/broken, GnuWin32 is good.')
-                return False
+            print('warning: your version of the tool "which"'
+                  ' is buggy/outdated')
+            if os.name == "nt":
+                print('         unxutils is old/broken, GnuWin32 is good.')
+            return False
 
 def get_prog_version(prog):
     if prog == "libdiscid":
         version = discid.LIBDISCID_VERSION_STRING
     elif prog == "cdrdao":
-        outdata = Popen([prog], stderr=PIPE).communicate()[1]
+        outdata = Popen([prog], stderr=PIPE,
+                        bufsize=PIPE_BUFSIZE).communicate()[1]
         version = b" ".join(outdata.splitlines()[0].split()[::2][0:2])
     else:
         version = prog
 
     return decode(version)
 
+def which(program):
+    """Returns the path of the program in PATH, None if it is not found
+
+    The external "which" is only started when shutil.which isn't available.
+    """
+    if shutil_which is not None:
+        return shutil_which(program)
+    p_which = Popen(["which", program], stdout=PIPE, stderr=DEVNULL,
+                    bufsize=PIPE_BUFSIZE)
+    program_path = p_which.communicate()[0].strip()
+    if p_which.returncode == 0:
+        return decode(program_path)
+    else:
+        return None
+
+def search_path(program):
+    """Returns the path of an executable program in PATH, None if not found
+
+    This is used when there is no trustworthy "which".
+    """
+    if os.name == "nt":
+        extensions = [""] + os.environ.get("PATHEXT", ".EXE").split(os.pathsep)
+    else:
+        extensions = [""]
+    for directory in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        for extension in extensions:
+            candidate = os.path.join(directory, program + extension)
+            if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                return candidate
+    return None
+
 def has_program(program, strict=False):
     """When the backend is only a symlink to another backend,
        we will return False, unless we strictly want to use this backend.
+
+    The result is cached, so every program is only searched once.
     """
+    key = (program, strict)
+    if key not in program_cache:
+        program_cache[key] = search_program(program, strict)
+    return program_cache[key]
+
+def search_program(program, strict=False):
     if program == "libdiscid":
         return "isrc" in discid.FEATURES
 
-    with open(os.devnull, "w") as devnull:
-        if options.sane_which:
-            p_which = Popen(["which", program], stdout=PIPE, stderr=devnull)
-            program_path = p_which.communicate()[0].strip()
-            if p_which.returncode == 0:
-                # check if it is only a symlink to another backend
-                real_program = os.path.basename(os.path.realpath(program_path))
-                if program != real_program and (
-                        real_program in BACKENDS or real_program in BROWSERS):
-                    if strict:
-                        print("WARNING: %s is a symlink to %s"
-                              % (program, real_program))
-                        return True
-                    else:
-                        return False # use real program (target) instead
-                return True
-            else:
-                return False
-        elif program in BACKENDS:
-            try:
-                # we just try to start these non-interactive console apps
-                call([program], stdout=devnull, stderr=devnull)
-            except OSError:
-                return False
-            else:
-                return True
+    if options.sane_which:
+        program_path = which(program)
+    elif program in BACKENDS:
+        program_path = search_path(program)
+    else:
+        return False
+
+    if program_path is None:
+        return False
+    # check if it is only a symlink to another backend
+    real_program = os.path.basename(os.path.realpath(program_path))
+    if program != real_program and (
+            real_program in BACKENDS or real_program in BROWSERS):
+        if strict:
+            print("WARNING: %s is a symlink to %s" % (program, real_program))
+            return True
         else:
-            return False
+            return False # use real program (target) instead
+    return True
 
 def find_backend():
     """search for an available backend
@@ -387,6 +453,9 @@ def find_browser():
 def open_browser(url, exit=False, submit=False):
     """open url in the selected browser, default if none
     """
+    if options.browser is None:
+        # only searched when needed, most runs don't open a browser
+        options.browser = find_browser()
     if options.browser:
         if exit:
             try:
@@ -408,8 +477,7 @@ def open_browser(url, exit=False, submit=False):
                 if options.debug:
                     Popen([options.browser, url])
                 else:
-                    with open(os.devnull, "w") as devnull:
-                        Popen([options.browser, url], stdout=devnull)
+                    Popen([options.browser, url], stdout=DEVNULL)
             except OSError as err:
                 error = ["Couldn't open the url in %s: %s"
                             % (options.browser, str(err))]
@@ -437,7 +505,8 @@ def get_real_mac_device(option_device):
     We ask drutil what device name corresponds to that drive
     in order so we can use it as a drive for libdiscid
     """
-    proc = Popen(["drutil", "status", "-drive", option_device], stdout=PIPE)
+    proc = Popen(["drutil", "status", "-drive", option_device], stdout=PIPE,
+                 bufsize=PIPE_BUFSIZE)
     try:
         given = proc.communicate()[0].splitlines()[3].split("Name:")[1].strip()
     except IndexError:
@@ -458,17 +527,17 @@ codecs.register(cp65001)
 def printf(format_string, *args):
     """Print with the % and without additional spaces or newlines
     """
-    if not args:
+    if args:
+        sys.stdout.write(format_string % args)
+    else:
         # make it convenient to use without args -> different to C
-        args = (format_string, )
-        format_string = "%s"
-    sys.stdout.write(format_string % args)
+        sys.stdout.write(format_string)
 
 def decode(msg):
     """This will replace unsuitable characters and use stdin encoding
     """
     if isinstance(msg, bytes):
-        return msg.decode(sys.stdin.encoding, "replace")
+        return msg.decode(STDIN_ENCODING, "replace")
     else:
         return unicode_string(msg)
 
@@ -476,17 +545,16 @@ def encode(msg):
     """This will replace unsuitable characters and use stdout encoding
     """
     if isinstance(msg, unicode_string):
-        return msg.encode(sys.stdout.encoding, "replace")
+        return msg.encode(STDOUT_ENCODING, "replace")
+    elif isinstance(msg, bytes):
+        return msg
     else:
         return bytes(msg)
 
 def print_encoded(*args):
     """This will replace unsuitable characters and doesn't append a newline
     """
-    stringArgs = ()
-    for arg in args:
-        stringArgs += encode(arg),
-    msg = b" ".join(stringArgs)
+    msg = b" ".join([encode(arg) for arg in args])
     if not msg.endswith(b"\n"):
         msg += b" "
     if os.name == "nt":
@@ -515,28 +583,28 @@ def print_release(release, position=None):
     catnumbers = ", ".join(catnumber_list)
 
     if position is None:
-        print_encoded("Artist:\t\t%s\n" % release["artist-credit-phrase"])
-        print_encoded("Release:\t%s" % release["title"])
+        print_encoded("Artist:\t\t%s\nRelease:\t%s"
+                      % (release["artist-credit-phrase"], release["title"]))
     else:
-        print_encoded("%#2d:" % position)
-        print_encoded("%s - %s" % (
+        print_encoded("%#2d:" % position, "%s - %s" % (
                       release["artist-credit-phrase"], release["title"]))
     if release.get("status"):
         print("(%s)" % release["status"])
     else:
         print("")
     if position is None:
-        print_encoded("Release Event:\t%s\t%s\n" % (date, country))
-        print_encoded("Barcode:\t%s\n" % release.get("barcode") or "")
-        print_encoded("Catalog No.:\t%s\n" % catnumbers)
-        print_encoded("MusicBrainz ID:\t%s\n" % release["id"])
+        print_encoded("Release Event:\t%s\t%s\n"
+                      "Barcode:\t%s\n"
+                      "Catalog No.:\t%s\n"
+                      "MusicBrainz ID:\t%s\n"
+                      % (date, country, release.get("barcode") or "",
+                         catnumbers, release["id"]))
     else:
         print_encoded("\t%s\t%s\t%s\t%s\n" % (
                       country, date, barcode, catnumbers))
 
 def print_error(*args):
-    string_args = tuple([str(arg) for arg in args])
-    logger.error("\n       ".join(string_args))
+    logger.error("\n       ".join([str(arg) for arg in args]))
 
 
 def backend_error(err):
@@ -551,6 +619,9 @@ def ask_for_submission(url, print_url=False):
         printf("Would you like to open the browser to submit the disc?")
         submit_requested = user_input(" [y/N] ").lower() == "y"
 
+    if submit_requested or print_url:
+        # the disc will be attached in the browser, don't keep stale data
+        ws2.clear_cached()
     if submit_requested:
         open_browser(url, exit=True, submit=True)
     elif print_url:
@@ -563,10 +634,16 @@ class WebService2():
     This uses musicbrainzngs as a wrapper itself.
     """
 
-    def __init__(self, username=None):
+    def __init__(self, username=None, use_cache=True):
+        # not imported at the top, --help and --version don't need it
+        global musicbrainzngs
+        import musicbrainzngs
         self.auth = False
         self.keyring_failed = False
         self.username = username
+        self.use_cache = use_cache
+        self.cache_dir = os.path.join(get_cache_home(), options.server)
+        self.cache_files = set()    # used in this run
         musicbrainzngs.set_hostname(options.server)
         musicbrainzngs.set_useragent(AGENT_NAME, __version__,
                 "http://github.com/JonnyJD/musicbrainz-isrcsubmit")
@@ -595,32 +672,87 @@ class WebService2():
             if keyring is not None and options.keyring:
                 keyring.set_password(options.server, self.username, password)
 
-    def get_releases_by_discid(self, disc_id, includes=[]):
+    def cache_file(self, kind, mbid, includes):
+        name = "%s-%s-%s.json" % (kind, mbid, "+".join(sorted(includes)))
+        return os.path.join(self.cache_dir, name)
+
+    def load_cached(self, cache_file):
+        """Returns the cached response or None if there is none
+        """
+        if not self.use_cache:
+            return None
         try:
-            response = musicbrainzngs.get_releases_by_discid(disc_id,
-                                                             includes=includes)
-        except ResponseError as err:
-            if err.cause.code == 404:
-                return []
-            else:
+            if time.time() - os.path.getmtime(cache_file) > CACHE_TTL:
+                return None
+            with open(cache_file, "r") as cached:
+                response = json.load(cached)
+        except (IOError, OSError, ValueError):
+            return None
+        else:
+            logger.info("using cached %s", cache_file)
+            self.cache_files.add(cache_file)
+            return response
+
+    def save_cached(self, cache_file, response):
+        if not self.use_cache:
+            return
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with open(cache_file, "w") as cached:
+                json.dump(response, cached)
+        except (IOError, OSError) as err:
+            logger.warning("Couldn't cache web service data: %s", err)
+        else:
+            self.cache_files.add(cache_file)
+
+    def clear_cached(self):
+        """Removes the cached data used in this run,
+        since it is outdated after an edit
+        """
+        for cache_file in self.cache_files:
+            try:
+                os.remove(cache_file)
+            except OSError:
+                pass
+        self.cache_files.clear()
+
+    def get_releases_by_discid(self, disc_id, includes=[]):
+        cache_file = self.cache_file("discid", disc_id, includes)
+        response = self.load_cached(cache_file)
+        if response is None:
+            try:
+                response = musicbrainzngs.get_releases_by_discid(disc_id,
+                                                            includes=includes)
+            except musicbrainzngs.ResponseError as err:
+                if err.cause.code == 404:
+                    return []
+                else:
+                    print_error("Couldn't fetch release: %s" % err)
+                    sys.exit(1)
+            except musicbrainzngs.WebServiceError as err:
                 print_error("Couldn't fetch release: %s" % err)
                 sys.exit(1)
-        except WebServiceError as err:
-            print_error("Couldn't fetch release: %s" % err)
-            sys.exit(1)
-        else:
             if response.get("disc"):
-                return response["disc"]["release-list"]
-            else:
-                return []
+                # only cache complete results, not stubs or empty results
+                self.save_cached(cache_file, response)
+        if response.get("disc"):
+            return response["disc"]["release-list"]
+        else:
+            return []
 
     def get_release_by_id(self, release_id, includes=[]):
-        try:
-            return musicbrainzngs.get_release_by_id(release_id,
-                                                    includes=includes)
-        except WebServiceError as err:
-            print_error("Couldn't fetch release: %s" % err)
-            sys.exit(1)
+        cache_file = self.cache_file("release", release_id, includes)
+        response = self.load_cached(cache_file)
+        if response is None:
+            try:
+                response = musicbrainzngs.get_release_by_id(release_id,
+                                                            includes=includes)
+            except musicbrainzngs.WebServiceError as err:
+                print_error("Couldn't fetch release: %s" % err)
+                sys.exit(1)
+            self.save_cached(cache_file, response)
+        return response
 
     def submit_isrcs(self, tracks2isrcs):
         logger.info("tracks2isrcs: %s", tracks2isrcs)
@@ -628,17 +760,18 @@ class WebService2():
             try:
                 self.authenticate()
                 musicbrainzngs.submit_isrcs(tracks2isrcs)
-            except AuthenticationError as err:
+            except musicbrainzngs.AuthenticationError as err:
                 print_error("Invalid credentials: %s" % err)
                 self.auth = False
                 self.keyring_failed = True
                 self.username = None
                 continue
-            except WebServiceError as err:
+            except musicbrainzngs.WebServiceError as err:
                 print_error("Couldn't send ISRCs: %s" % err)
                 sys.exit(1)
             else:
                 print("Successfully submitted %d ISRCS." % len(tracks2isrcs))
+                self.clear_cached()
                 break
 
 
@@ -648,10 +781,12 @@ class Disc(object):
         try:
             # calculate disc ID from disc
             if self._backend == "libdiscid" and not options.force_submit:
-                disc = discid.read(self._device, features=["mcn", "isrc"])
+                features = ["mcn", "isrc"]
             else:
-                disc = discid.read(self._device)
-            self._disc = disc
+                # only read the TOC, ISRCs and MCN take a lot longer
+                # and other backends read the ISRCs themselves
+                features = []
+            self._disc = discid.read(self._device, features=features)
         except DiscError as err:
             print_error("DiscID calculation failed: %s" % err)
             sys.exit(1)
@@ -794,7 +929,7 @@ class Disc(object):
             else:
                 print("recalculating to re-check..")
                 self.read_disc()
-                self.get_release(verified=True)
+                return self.get_release(verified=True)
 
         self._release = chosen_release
         return chosen_release
@@ -811,150 +946,174 @@ def get_disc(device, backend, verified=False):
     return disc
 
 
-def gather_isrcs(disc, backend, device):
-    """read the disc in the device with the backend and extract the ISRCs
-    """
-    backend_output = []
-    devnull = open(os.devnull, "w")
-
-    if backend == "libdiscid":
-        pattern = r'[A-Z]{2}[A-Z0-9]{3}\d{2}\d{5}'
-        for track in disc.tracks:
-            if track.isrc:
-                match = re.match(pattern, track.isrc)
-                if match is None:
-                    print("no valid ISRC: %s" % track.isrc)
-                else:
-                    backend_output.append((track.number, track.isrc))
+ISRC_PATTERN = re.compile(r'[A-Z]{2}[A-Z0-9]{3}\d{2}\d{5}')
 
-    # redundant to "libdiscid", but this might be handy for prerelease testing
-    elif backend == "discisrc":
-        pattern = \
-            r'Track\s+([0-9]+)\s+:\s+([A-Z]{2})-?([A-Z0-9]{3})-?(\d{2})-?(\d{5})'
-        try:
-            if sys.platform == "darwin":
-                device = get_real_mac_device(device)
-            proc = Popen([backend, device], stdout=PIPE)
-            isrcout = proc.stdout
-        except OSError as err:
-            backend_error(err)
-        for line in isrcout:
-            line = decode(line) # explicitely decode from pipe
-            ext_logger = logging.getLogger("discisrc")
-            ext_logger.debug(line.rstrip())    # rstrip newline
-            if line.startswith("Track") and len(line) > 12:
-                match = re.search(pattern, line)
-                if match is None:
-                    print("can't find ISRC in: %s" % line)
-                    continue
-                track_number = int(match.group(1))
-                isrc = ("%s%s%s%s" % (match.group(2), match.group(3),
-                                      match.group(4), match.group(5)))
-                backend_output.append((track_number, isrc))
+def is_discisrc_line(line):
+    return line.startswith("Track") and len(line) > 12
+
+def is_mediatools_line(line):
+    return line.startswith("ISRC") and not line.startswith("ISRCS")
+
+# (track number, ISRC possibly with dashes)
+DISCISRC_PATTERN = re.compile(
+        r'Track\s+([0-9]+)\s+:\s+([A-Z]{2}-?[A-Z0-9]{3}-?\d{2}-?\d{5})')
+MEDIATOOLS_PATTERN = re.compile(
+        r'ISRC\s+([0-9]+)\s+([A-Z]{2}-?[A-Z0-9]{3}-?\d{2}-?\d{5})')
+
+def discisrc_args(device):
+    if sys.platform == "darwin":
+        # discisrc takes the device name, not the drive number
+        device = get_real_mac_device(device)
+    return ["discisrc", device]
 
+# backends that print one ISRC per line
+# backend: (arguments, check if the line should have an ISRC, ISRC pattern)
+ISRC_LINE_BACKENDS = {
+    # redundant to "libdiscid", but this might be handy for prerelease testing
+    "discisrc": (discisrc_args, is_discisrc_line, DISCISRC_PATTERN),
     # media_info is a preview version of mediatools, both are for Windows
     # this does some kind of raw read
-    elif backend in ["mediatools", "media_info"]:
-        pattern = \
-            r'ISRC\s+([0-9]+)\s+([A-Z]{2})-?([A-Z0-9]{3})-?(\d{2})-?(\d{5})'
-        if backend == "mediatools":
-            args = [backend, "drive", device, "isrc"]
-        else:
-            args = [backend, device]
-        try:
-            proc = Popen(args, stdout=PIPE)
-            isrcout = proc.stdout
-        except OSError as err:
-            backend_error(err)
-        for line in isrcout:
-            line = decode(line) # explicitely decode from pipe
-            ext_logger = logging.getLogger("mediatools")
-            ext_logger.debug(line.rstrip())    # rstrip newline
-            if line.startswith("ISRC") and not line.startswith("ISRCS"):
-                match = re.search(pattern, line)
-                if match is None:
-                    print("can't find ISRC in: %s" % line)
-                    continue
-                track_number = int(match.group(1))
-                isrc = ("%s%s%s%s" % (match.group(2), match.group(3),
-                                      match.group(4), match.group(5)))
-                backend_output.append((track_number, isrc))
-
-    # cdrdao will create a temp file and we delete it afterwards
-    # cdrdao is also available for windows
-    # this will also fetch ISRCs from CD-TEXT
-    elif backend == "cdrdao":
-        # no byte pattern, file is opened as unicode
-        pattern = r'[A-Z]{2}[A-Z0-9]{3}\d{2}\d{5}'
-        tmpname = "cdrdao-%s.toc" % datetime.now()
-        tmpname = tmpname.replace(":", "-")     # : is invalid on windows
-        tmpfile = os.path.join(tempfile.gettempdir(), tmpname)
-        logger.info("Saving toc in %s..", tmpfile)
-        if os.name == "nt":
-            if device != discid.get_default_device():
-                logger.warning("cdrdao uses the default device")
-            args = [backend, "read-toc", "-v", "0", tmpfile]
-        else:
-            args = [backend, "read-toc", "--device", device, "-v", "0", tmpfile]
-        try:
-            if options.debug:
-                proc = Popen(args, stdout=devnull)
+    "mediatools": (lambda device: ["mediatools", "drive", device, "isrc"],
+                   is_mediatools_line, MEDIATOOLS_PATTERN),
+    "media_info": (lambda device: ["media_info", device],
+                   is_mediatools_line, MEDIATOOLS_PATTERN),
+}
+
+def read_libdiscid(disc, backend, device):
+    """use the ISRCs libdiscid read together with the disc ID
+    """
+    backend_output = []
+    for track in disc.tracks:
+        if track.isrc:
+            match = ISRC_PATTERN.match(track.isrc)
+            if match is None:
+                print("no valid ISRC: %s" % track.isrc)
             else:
-                proc = Popen(args, stdout=devnull, stderr=devnull)
-            if proc.wait() != 0:
-                print_error("%s returned with %i" % (backend, proc.returncode))
-                sys.exit(1)
-        except OSError as err:
-            backend_error(err)
+                backend_output.append((track.number, track.isrc))
+    return backend_output
+
+def read_isrc_lines(disc, backend, device):
+    """run a backend printing ISRCs line by line and extract the ISRCs
+    """
+    get_args, is_isrc_line, pattern = ISRC_LINE_BACKENDS[backend]
+    ext_logger = logging.getLogger(backend)
+    backend_output = []
+    try:
+        proc = Popen(get_args(device), stdout=PIPE, bufsize=PIPE_BUFSIZE)
+    except OSError as err:
+        backend_error(err)
+    for line in proc.stdout:
+        line = decode(line) # explicitely decode from pipe
+        ext_logger.debug(line.rstrip())    # rstrip newline
+        if is_isrc_line(line):
+            match = pattern.search(line)
+            if match is None:
+                print("can't find ISRC in: %s" % line)
+                continue
+            track_number = int(match.group(1))
+            isrc = match.group(2).replace("-", "")
+            backend_output.append((track_number, isrc))
+    proc.stdout.close()
+    proc.wait()
+    return backend_output
+
+def read_cdrdao(disc, backend, device):
+    """let cdrdao write a toc file and extract the ISRCs from that
+
+    cdrdao will create a temp file and we delete it afterwards
+    cdrdao is also available for windows
+    this will also fetch ISRCs from CD-TEXT
+    """
+    backend_output = []
+    tmpname = "cdrdao-%s.toc" % datetime.now()
+    tmpname = tmpname.replace(":", "-")     # : is invalid on windows
+    tmpfile = os.path.join(tempfile.gettempdir(), tmpname)
+    logger.info("Saving toc in %s..", tmpfile)
+    if os.name == "nt":
+        if device != discid.get_default_device():
+            logger.warning("cdrdao uses the default device")
+        args = [backend, "read-toc", "-v", "0", tmpfile]
+    else:
+        args = [backend, "read-toc", "--device", device, "-v", "0", tmpfile]
+    try:
+        if options.debug:
+            proc = Popen(args, stdout=DEVNULL)
         else:
-            # that file seems to be opened in Unicode mode in Python 3
-            with open(tmpfile, "r") as toc:
-                track_number = None
-                for line in toc:
-                    ext_logger = logging.getLogger("cdrdao")
-                    ext_logger.debug(line.rstrip())    # rstrip newline
-                    words = line.split()
-                    if words:
-                        if words[0] == "//":
-                            track_number = int(words[2])
-                        elif words[0] == "ISRC" and track_number is not None:
-                            isrc = "".join(words[1:]).strip('"- ')
-                            match = re.match(pattern, isrc)
-                            if match is None:
-                                print("no valid ISRC: %s" % isrc)
-                            else:
-                                backend_output.append((track_number, isrc))
-                                # safeguard against missing trackNumber lines
-                                # or duplicated ISRC tags (like in CD-Text)
-                                track_number = None
-        finally:
-            try:
-                os.unlink(tmpfile)
-            except OSError:
-                pass
+            proc = Popen(args, stdout=DEVNULL, stderr=DEVNULL)
+        if proc.wait() != 0:
+            print_error("%s returned with %i" % (backend, proc.returncode))
+            sys.exit(1)
+    except OSError as err:
+        backend_error(err)
+    else:
+        # that file seems to be opened in Unicode mode in Python 3
+        with open(tmpfile, "r") as toc:
+            ext_logger = logging.getLogger("cdrdao")
+            track_number = None
+            for line in toc:
+                ext_logger.debug(line.rstrip())    # rstrip newline
+                words = line.split()
+                if words:
+                    if words[0] == "//":
+                        track_number = int(words[2])
+                    elif words[0] == "ISRC" and track_number is not None:
+                        isrc = "".join(words[1:]).strip('"- ')
+                        match = ISRC_PATTERN.match(isrc)
+                        if match is None:
+                            print("no valid ISRC: %s" % isrc)
+                        else:
+                            backend_output.append((track_number, isrc))
+                            # safeguard against missing trackNumber lines
+                            # or duplicated ISRC tags (like in CD-Text)
+                            track_number = None
+    finally:
+        try:
+            os.unlink(tmpfile)
+        except OSError:
+            pass
 
-    devnull.close()
     return backend_output
 
+# backend: function returning a list of (track number, ISRC)
+ISRC_READERS = {
+    "libdiscid": read_libdiscid,
+    "cdrdao": read_cdrdao,
+    "discisrc": read_isrc_lines,
+    "mediatools": read_isrc_lines,
+    "media_info": read_isrc_lines,
+}
+
+def gather_isrcs(disc, backend, device):
+    """read the disc in the device with the backend and extract the ISRCs
+    """
+    return ISRC_READERS[backend](disc, backend, device)
+
 def check_isrcs_local(backend_output, mb_tracks):
     """check backend_output for (local) duplicates and inconsistencies
     """
     isrcs = dict()          # isrcs found on disc
     tracks2isrcs = dict()   # isrcs to be submitted
     errors = 0
+    messages = []           # printed together at the end
+    own_tracks = dict()     # track number: OwnTrack
+
+    # track numbers each ISRC was found for
+    isrc_tracks = defaultdict(list)
+    for (track_number, isrc) in backend_output:
+        isrc_tracks[isrc].append(track_number)
+
+    for isrc, track_numbers in isrc_tracks.items():
+        isrcs[isrc] = Isrc(isrc)
+        # check if we found this ISRC for multiple tracks
+        if len(track_numbers) > 1:
+            track_list = [str(number) for number in track_numbers]
+            print_error("%s gave the same ISRC for multiple tracks!"
+                        % options.backend,
+                        "ISRC: %s\ttracks: %s"
+                        % (isrc, ", ".join(track_list)))
+            errors += 1
 
     for (track_number, isrc) in backend_output:
-        if isrc not in isrcs:
-            isrcs[isrc] = Isrc(isrc)
-            # check if we found this ISRC for multiple tracks
-            with_isrc = [item for item in backend_output if item[1] == isrc]
-            if len(with_isrc) > 1:
-                track_list = [str(item[0]) for item in with_isrc]
-                print_error("%s gave the same ISRC for multiple tracks!"
-                            % options.backend,
-                            "ISRC: %s\ttracks: %s"
-                            % (isrc, ", ".join(track_list)))
-                errors += 1
         try:
             track = mb_tracks[track_number - 1]
         except IndexError:
@@ -962,43 +1121,48 @@ def check_isrcs_local(backend_output, mb_tracks):
                         % (isrc, track_number))
             errors += 1
         else:
-            own_track = OwnTrack(track, track_number)
+            own_track = own_tracks.get(track_number)
+            if own_track is None:
+                own_track = OwnTrack(track, track_number)
+                own_tracks[track_number] = own_track
             isrcs[isrc].add_track(own_track)
             # check if the ISRC was already added to the track
-            if isrc not in own_track.get("isrc-list", []):
+            if not own_track.has_isrc(isrc):
                 # single isrcs work in python-musicbrainzngs 0.4, but not 0.3
                 # lists of isrcs don't work in 0.4 though, see pymbngs #113
                 tracks2isrcs[own_track["id"]] = isrc
-                print("found new ISRC for track %d: %s"
-                      % (track_number, isrc))
+                messages.append("found new ISRC for track %d: %s"
+                                % (track_number, isrc))
             else:
-                print("%s is already attached to track %d"
-                      % (isrc, track_number))
+                messages.append("%s is already attached to track %d"
+                                % (isrc, track_number))
 
+    if messages:
+        print("\n".join(messages))
     return isrcs, tracks2isrcs, errors
 
 def check_global_duplicates(release, mb_tracks, isrcs):
     """Help cleaning up global duplicates with the information we got
     from our disc.
     """
-    duplicates = 0
+    if not isrcs:
+        return      # nothing found on the disc to compare with
     # add already attached ISRCs
-    for i in range(0, len(mb_tracks)):
-        track = mb_tracks[i]
-        track_number = i + 1
-        track = Track(track, track_number)
-        for isrc in track.get("isrc-list", []):
-            # only check ISRCS we also found on our disc
-            if isrc in isrcs:
+    for track_number, track in enumerate(mb_tracks, 1):
+        # only check ISRCS we also found on our disc
+        found = [isrc for isrc in track["recording"].get("isrc-list", ())
+                 if isrc in isrcs]
+        if found:
+            track = Track(track, track_number)
+            for isrc in found:
                 isrcs[isrc].add_track(track)
     # check if we have multiple tracks for one ISRC
-    for isrc in isrcs:
-        if len(isrcs[isrc].get_tracks()) > 1:
-            duplicates += 1
+    duplicates = len([isrc for isrc in isrcs.values()
+                      if len(isrc.get_tracks()) > 1])
 
     if duplicates > 0:
-        printf("\nThere were %d ISRCs ", duplicates)
-        print("that are attached to multiple tracks on this release.")
+        print("\nThere were %d ISRCs that are attached to multiple tracks"
+              " on this release." % duplicates)
         choice = user_input("Do you want to help clean those up? [y/N] ")
         if choice.lower() == "y":
             cleanup_isrcs(release, isrcs)
@@ -1013,34 +1177,28 @@ def cleanup_isrcs(release, isrcs):
         if len(tracks) > 1:
             print("\nISRC %s attached to:" % isrc)
             for track in tracks:
-                printf("\t")
                 artist = track.get("artist-credit-phrase")
                 if artist and artist != release["artist-credit-phrase"]:
                     string = "%s - %s" % (artist, track["title"])
                 else:
                     string = "%s" % track["title"]
-                print_encoded(string)
-                # tab alignment
-                if len(string) >= 32:
-                    printf("\n%s",  " " * 40)
+                # align to column 40, print_encoded adds a space
+                if len(string) < 32:
+                    print_encoded("\t" + string.ljust(31))
+                    alignment = ""
                 else:
-                    if len(string) < 7:
-                        printf("\t")
-                    if len(string) < 15:
-                        printf("\t")
-                    if len(string) < 23:
-                        printf("\t")
-                    if len(string) < 31:
-                        printf("\t")
-
-                printf("\t track %s", track["position"])
+                    print_encoded("\t" + string)
+                    alignment = "\n" + " " * 40
                 if isinstance(track, OwnTrack):
-                    print("   [OUR EVALUATION]")
+                    evaluation = "   [OUR EVALUATION]"
                 else:
-                    print("")
+                    evaluation = ""
+                print("%s\t track %s%s"
+                      % (alignment, track["position"], evaluation))
 
             url = "http://%s/isrc/%s" % (options.server, isrc)
             if user_input("Open ISRC in the browser? [Y/n] ").lower() != "n":
+                ws2.clear_cached()
                 open_browser(url)
                 user_input("(press <return> when done with this ISRC) ")
 
@@ -1056,7 +1214,7 @@ def main(argv):
 
     # global variables
     options = gather_options(argv)
-    ws2 = WebService2(options.user)
+    ws2 = WebService2(options.user, use_cache=options.cache)
 
     if options.debug:
         logging.getLogger().setLevel(logging.DEBUG)
@@ -1079,21 +1237,17 @@ def main(argv):
     print("using %s" % get_prog_version(options.backend))
 
     disc = get_disc(options.device, options.backend)
-    disc.get_release()
+    release = disc.get_release()
     print("")
-    print_release(disc.release)
+    print_release(release)
     if not disc.asked_for_submission:
         print("")
         print("Is this information different for your release?")
         ask_for_submission(disc.submission_url)
 
-    media = []
-    for medium in disc.release["medium-list"]:
-        for disc_entry in medium["disc-list"]:
-            if disc_entry["id"] == disc.id:
-                media.append(medium)
-                break
-    if len(media) > 1:
+    media = [medium for medium in release["medium-list"]
+             if disc.id in [entry["id"] for entry in medium["disc-list"]]]
+    if len(media) != 1:
         raise DiscError("number of discs with id: %d" % len(media))
     mb_tracks = media[0]["track-list"]
 
@@ -1121,7 +1275,7 @@ def main(argv):
     # check for overall duplicate ISRCs, including server provided
     if update_intention:
         # the ISRCs are deemed correct, so we can use them to check others
-        check_global_duplicates(disc.release, mb_tracks, isrcs)
+        check_global_duplicates(release, mb_tracks, isrcs)
 
 if __name__ == "__main__":
     main(sys.argv)
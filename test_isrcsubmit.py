@@ -4,10 +4,13 @@
 
 import os
 import re
+import atexit
 import sys
 import math
 import json
 import pickle
+import shutil
+import tempfile
 import unittest
 from io import TextIOWrapper, BytesIO
 from subprocess import Popen
@@ -27,6 +30,11 @@ SCRIPT_NAME = "isrcsubmit.py"
 TEST_DATA = "test_data/"
 SAVE_RUN = False
 
+# don't touch the cache of the user
+CACHE_HOME = tempfile.mkdtemp()
+os.environ["XDG_CACHE_HOME"] = CACHE_HOME
+atexit.register(shutil.rmtree, CACHE_HOME, True)
+
 
 class TestInternal(unittest.TestCase):
     def setUp(self):
@@ -72,6 +80,27 @@ class TestInternal(unittest.TestCase):
         self.assertEqual(options.user, user)
         self.assertEqual(options.device, device)
 
+    def test_cache(self):
+        isrcsubmit.options = isrcsubmit.gather_options([SCRIPT_NAME])
+        ws2 = isrcsubmit.WebService2()
+        self.assertTrue(ws2.cache_dir.startswith(CACHE_HOME))
+        cache_file = ws2.cache_file("release", "some-id", ["labels", "isrcs"])
+        self.assertEqual(os.path.basename(cache_file),
+                         "release-some-id-isrcs+labels.json")
+        self.assertTrue(ws2.load_cached(cache_file) is None)
+        response = {"release": {"id": "some-id"}}
+        ws2.save_cached(cache_file, response)
+        self.assertEqual(ws2.load_cached(cache_file), response)
+        expired = os.path.getmtime(cache_file) - isrcsubmit.CACHE_TTL - 1
+        os.utime(cache_file, (expired, expired))
+        self.assertTrue(ws2.load_cached(cache_file) is None)
+        ws2.clear_cached()
+        self.assertTrue(ws2.load_cached(cache_file) is None)
+
+        ws2 = isrcsubmit.WebService2(use_cache=False)
+        ws2.save_cached(cache_file, response)
+        self.assertFalse(os.path.exists(cache_file))
+
     def tearDown(self):
         # restore output
         os.dup2(self._old_stdout, 1)
@@ -85,7 +114,10 @@ _mbngs_get_releases_by_discid = musicbrainzngs.get_releases_by_discid
 _mbngs_get_release_by_id = musicbrainzngs.get_release_by_id
 _mbngs_submit_isrcs = musicbrainzngs.submit_isrcs
 
+queried_discids = []
+
 def _get_releases_by_discid(disc_id, includes=[]):
+    queried_discids.append(disc_id)
     file_name = "%s%s_releases.json" % (TEST_DATA, disc_id)
     if SAVE_RUN:
         releases = _mbngs_get_releases_by_discid(disc_id, includes)
@@ -160,7 +192,8 @@ isrcsubmit.discid.read = _read
 # - - - - - - - - - -
 
 class _Popen(Popen):
-    def __new__(cls, args, stdin=sys.stdin, stdout=sys.stdout, stderr=sys.stderr):
+    def __new__(cls, args, stdin=sys.stdin, stdout=sys.stdout, stderr=sys.stderr,
+                bufsize=-1):
         if args[0] == "cdrdao":
             file_name = "%s%s_cdrdao.toc" % (TEST_DATA, mocked_disc_id)
             if SAVE_RUN:
@@ -171,7 +204,8 @@ class _Popen(Popen):
             else:
                 # don't actually call cdrdao
                 args = ["echo", "mocked cdrdao"]
-        return Popen(args, stdin=stdin, stdout=stdout, stderr=stderr)
+        return Popen(args, stdin=stdin, stdout=stdout, stderr=stderr,
+                     bufsize=bufsize)
 
 isrcsubmit.Popen = _Popen
 
@@ -362,6 +396,22 @@ class TestScript(unittest.TestCase):
             self.assert_output("GBBBN7902023 is already attached to track 7")
             self.assert_output("No new ISRCs")
 
+    def test_cache_cleared_for_submission(self):
+        global mocked_disc_id
+        mocked_disc_id = "hSI7B4G4AkB5.DEBcW.3KCn.D_E-"
+        answers["choice"] = 0
+        shutil.rmtree(os.path.join(CACHE_HOME, "isrcsubmit"), True)
+        del queried_discids[:]
+        for run in range(2):
+            try:
+                isrcsubmit.main([SCRIPT_NAME, "--backend", "cdrdao", "--device", "/dev/cdrw"])
+            except SystemExit:
+                pass
+        # the disc is attached in the browser, so the second run has to ask
+        self.assert_output("Please submit the Disc ID with this url:")
+        self.assertEqual(queried_discids.count(mocked_disc_id), 2)
+        self.assertFalse(isrcsubmit.ws2.cache_files)
+
     def tearDown(self):
         # restore output
         sys.stdout = self._old_stdout